@@ -0,0 +1,99 @@
+from __future__ import annotations
+import os
+import socket
+import ssl
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Optional
+
+from .cache import cache_get_json, cache_set_json
+
+# Negative cache / circuit breaker for unreachable hosts. After a DNS failure
+# (whole host) or a connect failure (host:port) the circuit stays open for
+# HOST_DOWN_TTL_SECONDS and probes short-circuit instead of waiting for their
+# timeouts. Expiry of the entry acts as the half-open retry.
+HOST_DOWN_TTL_SECONDS = int(os.getenv("HOST_DOWN_TTL_SECONDS", "300"))
+# How long a Redis hit is remembered in-process before asking Redis again.
+LOCAL_TTL_SECONDS = 30
+# Cap on in-process entries; expired ones are swept when it is reached.
+LOCAL_MAX_ENTRIES = 10000
+
+# key -> monotonic expiry
+_local: "OrderedDict[str, float]" = OrderedDict()
+
+
+def _key(host: str, port: Optional[int] = None) -> str:
+    return f"down:{host}" if port is None else f"down:{host}:{port}"
+
+
+def _remember(key: str, expires: float) -> None:
+    """Store a local entry, keeping _local bounded by LOCAL_MAX_ENTRIES."""
+    _local.pop(key, None)
+    _local[key] = expires
+    if len(_local) <= LOCAL_MAX_ENTRIES:
+        return
+    now = time.monotonic()
+    for k in [k for k, exp in _local.items() if exp <= now]:
+        del _local[k]
+    while len(_local) > LOCAL_MAX_ENTRIES:
+        _local.popitem(last=False)
+
+
+def _caused_by(exc: BaseException, kind: type) -> bool:
+    seen = 0
+    e: Optional[BaseException] = exc
+    while e is not None and seen < 10:
+        if isinstance(e, kind):
+            return True
+        e = e.__cause__ or e.__context__
+        seen += 1
+    return False
+
+
+def is_dns_failure(exc: BaseException) -> bool:
+    """True when exc (or anything in its cause chain) is a name resolution error."""
+    return _caused_by(exc, socket.gaierror)
+
+
+def is_tls_failure(exc: BaseException) -> bool:
+    """True when exc (or anything in its cause chain) is a TLS error.
+
+    httpcore reports certificate and handshake failures as ConnectError, but
+    the host answered, so they must not open the circuit.
+    """
+    return _caused_by(exc, ssl.SSLError)
+
+
+async def is_open(host: str, port: Optional[int] = None) -> bool:
+    """Whether probes toward host (and optionally host:port) should be skipped."""
+    keys = [_key(host)]
+    if port is not None:
+        keys.append(_key(host, port))
+    now = time.monotonic()
+    if any(_local.get(k, 0) > now for k in keys):
+        return True
+    for k in keys:
+        if await cache_get_json(k):
+            _remember(k, now + min(LOCAL_TTL_SECONDS, HOST_DOWN_TTL_SECONDS))
+            return True
+    return False
+
+
+async def record_failure(host: str, port: Optional[int] = None, reason: str = "connect") -> None:
+    """Open the circuit for host (DNS) or host:port (connect) for the cool-down period."""
+    k = _key(host, port)
+    _remember(k, time.monotonic() + HOST_DOWN_TTL_SECONDS)
+    await cache_set_json(
+        k,
+        {"reason": reason, "ts": datetime.now(timezone.utc).isoformat()},
+        ttl=HOST_DOWN_TTL_SECONDS,
+    )
+
+
+async def record_exception(host: str, port: Optional[int], exc: BaseException) -> None:
+    """Classify a connection-stage exception and open the matching circuit."""
+    if is_dns_failure(exc):
+        await record_failure(host, None, "dns")
+    else:
+        await record_failure(host, port, "connect")
@@ -3,6 +3,8 @@ import os
 import json
 from typing import Any, Optional
 
+from .metrics import CACHE_SECONDS, CACHE_TOTAL, timed
+
 try:
     from redis import asyncio as aioredis  # type: ignore
 except Exception:
@@ -28,11 +30,16 @@ async def cache_get_json(key: str) -> Optional[Any]:
     if not client:
         return None
     try:
-        data = await client.get(key)
+        async with timed(CACHE_SECONDS, "get"):
+            data = await client.get(key)
         if data:
-            return json.loads(data)
+            value = json.loads(data)
+            CACHE_TOTAL.inc(key.split(":", 1)[0], "hit" if value is not None else "miss")
+            return value
     except Exception:
+        CACHE_TOTAL.inc(key.split(":", 1)[0], "error")
         return None
+    CACHE_TOTAL.inc(key.split(":", 1)[0], "miss")
     return None
 
 
@@ -41,6 +48,7 @@ async def cache_set_json(key: str, value: Any, ttl: Optional[int] = None) -> Non
     if not client:
         return
     try:
-        await client.set(key, json.dumps(value), ex=ttl or CACHE_TTL_SECONDS)
+        async with timed(CACHE_SECONDS, "set"):
+            await client.set(key, json.dumps(value), ex=ttl or CACHE_TTL_SECONDS)
     except Exception:
         pass
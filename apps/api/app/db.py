@@ -1,10 +1,10 @@
 from __future__ import annotations
 import os
-from datetime import datetime
+from datetime import date, datetime, timezone
 from typing import Optional
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
-from sqlalchemy import String, Integer, DateTime, Float, JSON
+from sqlalchemy import String, Integer, Date, DateTime, Float, JSON, UniqueConstraint, case, select
 import asyncio
 
 
@@ -31,6 +31,16 @@ class Site(Base):
 
 
 
+class SiteSignals(Base):
+    """Full signal set from the latest scoring run of a host, served by /explain."""
+    __tablename__ = "site_signals"
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    host: Mapped[str] = mapped_column(String(255), unique=True)
+    model_version: Mapped[str] = mapped_column(String(16))
+    signals: Mapped[list] = mapped_column(JSON)
+    updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True))
+
+
 class Vote(Base):
     __tablename__ = "votes"
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
@@ -42,12 +52,84 @@ class Vote(Base):
 
 
 
+class VoteBucket(Base):
+    """Daily vote counts per host and label, maintained incrementally on each vote."""
+    __tablename__ = "vote_buckets"
+    __table_args__ = (UniqueConstraint("host", "day", "label"),)
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    host: Mapped[str] = mapped_column(String(255), index=True)
+    day: Mapped[date] = mapped_column(Date)
+    label: Mapped[str] = mapped_column(String(32))
+    count: Mapped[int] = mapped_column(Integer, default=0)
+
+
+def vote_day(ts: datetime) -> date:
+    """UTC calendar day a vote is bucketed under."""
+    return (ts.astimezone(timezone.utc) if ts.tzinfo else ts).date()
+
+
+def _insert():
+    if engine.dialect.name == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        from sqlalchemy.dialects.postgresql import insert
+    return insert(VoteBucket)
+
+
+def vote_bucket_upsert(host: str, day: date, label: str):
+    """Atomic insert-or-increment statement for one vote bucket."""
+    stmt = _insert().values(host=host, day=day, label=label, count=1)
+    return stmt.on_conflict_do_update(
+        index_elements=["host", "day", "label"], set_={"count": VoteBucket.count + 1}
+    )
+
+
+async def backfill_vote_buckets() -> None:
+    """Reconcile vote_buckets with votes grouped by (host, day, label).
+
+    Idempotent: a bucket is raised to its vote count, never lowered, so votes
+    written without buckets (e.g. by replicas still running older code during a
+    rolling deploy) are picked up by re-running `python -m app.migrate` after
+    the rollout, while concurrent increments are not overwritten.
+    """
+    async with SessionLocal() as session:
+        counts: dict = {}
+        for host, ts, label in (await session.execute(select(Vote.host, Vote.ts, Vote.label))).all():
+            key = (host, vote_day(ts), label)
+            counts[key] = counts.get(key, 0) + 1
+        if not counts:
+            return
+        stmt = _insert()
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["host", "day", "label"],
+            set_={
+                "count": case(
+                    (VoteBucket.count < stmt.excluded["count"], stmt.excluded["count"]), else_=VoteBucket.count
+                )
+            },
+        )
+        await session.execute(
+            stmt, [{"host": h, "day": d, "label": lb, "count": n} for (h, d, lb), n in counts.items()]
+        )
+        await session.commit()
+
+
+async def check_db(timeout: float = 2.0) -> None:
+    """Raise unless the database answers and the schema has been applied."""
+    async def _probe():
+        async with SessionLocal() as session:
+            await session.execute(select(Site.id).limit(1))
+
+    await asyncio.wait_for(_probe(), timeout)
+
+
 async def init_db(max_retries: int = 30, delay: float = 1.0):
     last_err = None
     for _ in range(max_retries):
         try:
             async with engine.begin() as conn:
                 await conn.run_sync(Base.metadata.create_all)
+            await backfill_vote_buckets()
             return
         except Exception as e:
             last_err = e
@@ -0,0 +1,152 @@
+from __future__ import annotations
+import asyncio
+import json
+import os
+from typing import AsyncIterator, Dict, Iterable, Optional, Set, Tuple
+
+from .cache import get_client
+
+# Score changes are appended to one Redis stream; stream entry IDs double as
+# SSE event IDs so clients can resume with Last-Event-ID.
+FEED_STREAM = "feed:sites"
+FEED_MAXLEN = int(os.getenv("FEED_MAXLEN", "100000"))
+FEED_BLOCK_MS = 15000
+FEED_BATCH = 500
+# Frames buffered per SSE client; a client that falls further behind is
+# disconnected and resumes from the stream with Last-Event-ID.
+FEED_QUEUE_MAX = int(os.getenv("FEED_QUEUE_MAX", "1000"))
+
+# One reader task per process tails the stream (a single blocking XREAD on the
+# shared pool) and fans entries out to the queues of clients watching the host.
+_watchers: Dict[str, Set[asyncio.Queue]] = {}
+_reader: Optional[asyncio.Task] = None
+
+
+async def publish_score(payload: dict) -> None:
+    """Append a SiteScore payload to the change feed (best effort)."""
+    client = await get_client()
+    if not client:
+        return
+    try:
+        await client.xadd(
+            FEED_STREAM,
+            {"host": payload["host"], "data": json.dumps(payload)},
+            maxlen=FEED_MAXLEN,
+            approximate=True,
+        )
+    except Exception:
+        pass
+
+
+def _sse(event: str, data: str, event_id: Optional[str] = None) -> str:
+    head = f"id: {event_id}\n" if event_id else ""
+    return f"{head}event: {event}\ndata: {data}\n\n"
+
+
+def _id_key(entry_id: str) -> Tuple[int, int]:
+    ms, _, seq = entry_id.partition("-")
+    return int(ms), int(seq or 0)
+
+
+def _close(q: asyncio.Queue) -> None:
+    """Detach q and wake its subscriber with the end-of-stream marker."""
+    for queues in _watchers.values():
+        queues.discard(q)
+    while not q.empty():
+        q.get_nowait()
+    q.put_nowait(None)
+
+
+def _unwatch(q: asyncio.Queue, hosts: Iterable[str]) -> None:
+    for h in hosts:
+        queues = _watchers.get(h)
+        if queues is not None:
+            queues.discard(q)
+            if not queues:
+                del _watchers[h]
+
+
+async def _read_loop(client, cursor: str) -> None:
+    global _reader
+    try:
+        while _watchers:
+            try:
+                res = await client.xread({FEED_STREAM: cursor}, count=FEED_BATCH, block=FEED_BLOCK_MS)
+            except Exception:
+                # Subscribers end their streams and reconnect with Last-Event-ID.
+                for q in {q for queues in _watchers.values() for q in queues}:
+                    _close(q)
+                _watchers.clear()
+                return
+            for _, entries in res or ():
+                for entry_id, fields in entries:
+                    cursor = entry_id
+                    for q in list(_watchers.get(fields.get("host"), ())):
+                        try:
+                            q.put_nowait((entry_id, fields.get("data", "{}")))
+                        except asyncio.QueueFull:
+                            _close(q)
+    finally:
+        if _reader is asyncio.current_task():
+            _reader = None
+
+
+def _ensure_reader(client, cursor: str) -> None:
+    global _reader
+    if _reader is None or _reader.done() or _reader.get_loop() is not asyncio.get_running_loop():
+        _reader = asyncio.create_task(_read_loop(client, cursor))
+
+
+async def subscribe(hosts: Iterable[str], last_id: Optional[str] = None) -> AsyncIterator[str]:
+    """Yield SSE frames for score updates of hosts, after last_id (or from now).
+
+    Entries after last_id are replayed from the stream before switching to the
+    process-wide reader. Emits a comment line when nothing arrived within
+    FEED_BLOCK_MS so proxies keep the connection open; ends the stream if Redis
+    fails mid-way or the client falls more than FEED_QUEUE_MAX frames behind.
+    """
+    client = await get_client()
+    if not client:
+        return
+    wanted = set(hosts)
+    q: asyncio.Queue = asyncio.Queue(maxsize=FEED_QUEUE_MAX)
+    # Attach first so nothing published while pinning "now" or replaying is missed;
+    # anything at or before the replayed position is skipped below.
+    for h in wanted:
+        _watchers.setdefault(h, set()).add(q)
+    try:
+        try:
+            # Pin "now" to a concrete ID; re-reading "$" would skip entries added between reads.
+            latest = await client.xrevrange(FEED_STREAM, count=1)
+        except Exception:
+            return
+        now_id = latest[0][0] if latest else "0-0"
+        _ensure_reader(client, now_id)
+        yield "retry: 5000\n\n"
+        seen = last_id or now_id
+        while last_id:
+            try:
+                res = await client.xread({FEED_STREAM: seen}, count=FEED_BATCH)
+            except Exception:
+                return
+            entries = res[0][1] if res else []
+            for entry_id, fields in entries:
+                seen = entry_id
+                if fields.get("host") in wanted:
+                    yield _sse("score", fields.get("data", "{}"), entry_id)
+            if len(entries) < FEED_BATCH:
+                break
+        seen_key = _id_key(seen)
+        while True:
+            try:
+                item = await asyncio.wait_for(q.get(), FEED_BLOCK_MS / 1000)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+            if item is None:
+                return  # client reconnects with Last-Event-ID
+            entry_id, data = item
+            if _id_key(entry_id) > seen_key:
+                yield _sse("score", data, entry_id)
+    finally:
+        _unwatch(q, wanted)
@@ -1,18 +1,26 @@
+import asyncio
 from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+import hashlib
+import json
 import os
 import re
-from fastapi import FastAPI
+import time
+from fastapi import FastAPI, HTTPException, Query, Request, Response
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
 
 from .schemas import SiteScore, Breakdown, Explanation, Signal, VoteRequest, VoteResponse
 from .scoring import (
     compose_score_dynamic,
-    compute_u_from_votes,
+    compute_u_from_buckets,
+    VOTE_HALF_LIFE_DAYS,
     classify_level,
     compute_u_adjusted,
     compose_score_weighted,
 )
-from .db import SessionLocal, init_db, Site, Vote
+from .db import SessionLocal, check_db, Site, SiteSignals, Vote, VoteBucket, vote_bucket_upsert, vote_day
 from .probes import (
     http_probe,
     domain_heuristics,
@@ -23,7 +31,17 @@ from .probes import (
     google_safe_browsing_check,
     seo_signals_probe,
 )
-from .cache import cache_get_json, cache_set_json
+from .cache import CACHE_TTL_SECONDS, cache_get_json, cache_set_json, get_client
+from .feed import publish_score, subscribe
+from .metrics import (
+    DB_SECONDS,
+    REQUEST_SECONDS,
+    SERVER_TIMING,
+    render as render_metrics,
+    server_timing_header,
+    start_request_timings,
+    timed,
+)
 
 
 app = FastAPI(
@@ -34,6 +52,10 @@ app = FastAPI(
 )
 
 API_PREFIX = "/v1"
+MODEL_VERSION = "v0.4"
+# How long shared caches may keep serving a score past max-age while revalidating.
+STALE_WHILE_REVALIDATE_SECONDS = int(os.getenv("STALE_WHILE_REVALIDATE_SECONDS", str(CACHE_TTL_SECONDS)))
+MAX_STREAM_HOSTS = 100
 
 
 def normalize_host(value: str) -> str:
@@ -53,28 +75,78 @@ def normalize_host(value: str) -> str:
     return host.rstrip('.')
 
 
-@app.on_event("startup")
-async def _startup():
-    await init_db()
+@app.middleware("http")
+async def _observe(request: Request, call_next):
+    entries = start_request_timings()
+    t0 = time.perf_counter()
+    try:
+        response = await call_next(request)
+    except Exception:
+        # Unhandled errors surface as 500s; record them before re-raising.
+        route = getattr(request.scope.get("route"), "path", "unmatched")
+        REQUEST_SECONDS.observe(time.perf_counter() - t0, request.method, route, "500")
+        raise
+    elapsed = time.perf_counter() - t0
+    route = getattr(request.scope.get("route"), "path", "unmatched")
+    REQUEST_SECONDS.observe(elapsed, request.method, route, str(response.status_code))
+    if SERVER_TIMING:
+        entries.append(("total", elapsed))
+        response.headers["Server-Timing"] = server_timing_header(entries)
+    return response
+
+
+def _etag(payload) -> str:
+    """Strong ETag over the canonical JSON form of payload."""
+    body = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+    return '"' + hashlib.sha256(body.encode()).hexdigest()[:32] + '"'
+
+
+def _not_modified(request: Request, etag: str, updated_at: datetime) -> bool:
+    """Evaluate If-None-Match, or If-Modified-Since when no If-None-Match is sent."""
+    inm = request.headers.get("if-none-match")
+    if inm is not None:
+        tags = [t.strip() for t in inm.split(",")]
+        return "*" in tags or etag in tags or f"W/{etag}" in tags
+    ims = request.headers.get("if-modified-since")
+    if not ims:
+        return False
+    try:
+        since = parsedate_to_datetime(ims)
+    except (TypeError, ValueError):
+        return False
+    if since.tzinfo is None:
+        since = since.replace(tzinfo=timezone.utc)
+    return updated_at.replace(microsecond=0) <= since
+
+
+def _conditional_json(request: Request, payload: dict, updated_at: datetime) -> Response:
+    """JSON response with validators and a Cache-Control lifetime that ends when the
+    server-side cache entry expires; 304 when the client's copy is current."""
+    age = (datetime.now(timezone.utc) - updated_at).total_seconds()
+    max_age = max(0, int(CACHE_TTL_SECONDS - age))
+    etag = _etag(payload)
+    headers = {
+        "ETag": etag,
+        "Last-Modified": format_datetime(updated_at.astimezone(timezone.utc), usegmt=True),
+        "Cache-Control": f"public, max-age={max_age}, stale-while-revalidate={STALE_WHILE_REVALIDATE_SECONDS}",
+    }
+    if _not_modified(request, etag, updated_at):
+        return Response(status_code=304, headers=headers)
+    return JSONResponse(payload, headers=headers)
 
 
-@app.get(f"{API_PREFIX}/sites/{{host}}", response_model=SiteScore)
-async def get_site_score(host: str):
-    host = normalize_host(host)
+async def _load_vote_buckets(host: str) -> list[dict]:
+    async with SessionLocal() as session:
+        async with timed(DB_SECONDS, "vote_buckets_by_host"):
+            res = await session.execute(select(VoteBucket).where(VoteBucket.host == host))
+        return [{"day": b.day, "label": b.label, "count": b.count} for b in res.scalars().all()]
 
-    # cache first
-    cached = await cache_get_json(f"site:{host}")
-    if cached:
-        return cached
 
-    # votes from DB
-    async with SessionLocal() as session:
-        res = await session.execute(select(Vote).where(Vote.host == host))
-        votes = [
-            {"label": v.label, "reason": v.reason, "ts": v.ts.isoformat()}
-            for v in res.scalars().all()
-        ]
+async def _score_and_store(host: str, vote_buckets: list[dict]) -> tuple[dict, list[dict]]:
+    """Run every probe once, compose the score and persist it with the full signal set.
 
+    Returns (SiteScore payload, signals) so /explain can be served from the same run.
+    """
     # probes
     https_ok, info = await http_probe(host)
     heur = domain_heuristics(host)
@@ -85,8 +157,8 @@ async def get_site_score(host: str):
     gsb = await google_safe_browsing_check(host)
     seo = await seo_signals_probe(host)
 
-    # U
-    U, counts = compute_u_from_votes(votes)
+    # U: decayed over daily vote buckets
+    U, counts, n_effective = compute_u_from_buckets(vote_buckets, datetime.now(timezone.utc).date(), VOTE_HALF_LIFE_DAYS)
     n_votes = sum(counts.values())
     include_u = n_votes > 0
 
@@ -133,7 +205,7 @@ async def get_site_score(host: str):
     if include_u:
         ramp_n = int(os.getenv("COMMUNITY_RAMP_N", "10") or 10)
         baseline = float(os.getenv("COMMUNITY_BASELINE", "0.5") or 0.5)
-        U_adj, u_factor = compute_u_adjusted(U, n_votes, baseline=baseline, ramp_n=ramp_n)
+        U_adj, u_factor = compute_u_adjusted(U, n_effective, baseline=baseline, ramp_n=ramp_n)
         score = compose_score_weighted(S, C, T, U_adj, u_factor)
         breakdown = {"S": S, "C": C, "T": T, "U": U_adj}
     else:
@@ -141,19 +213,56 @@ async def get_site_score(host: str):
         score = compose_score_dynamic(S, C, T, U, include_u)
     level = classify_level(score)
 
+    signals = [
+        Signal(key="https_ok", value=https_ok),
+        *[Signal(key=k, value=v) for k, v in info.items()],
+        *[Signal(key=f"transparency_{k}", value=v) for k, v in transp.items()],
+        *[Signal(key=f"email_{k}", value=v) for k, v in email_auth.items()],
+        Signal(key="tls_cert_days_to_expire", value=cert_days),
+        Signal(key="google_safe_browsing_flagged", value=gsb.get("flagged")),
+        *[Signal(key=f"seo_{k}", value=v) for k, v in seo.items()],
+        Signal(key="community_wilson", value=round(U, 2)),
+        Signal(key="votes_counts", value=counts),
+    ]
+    stored_signals = [sig.model_dump() for sig in signals]
+
     now = datetime.now(timezone.utc)
-    async with SessionLocal() as session:
-        existing = (await session.execute(select(Site).where(Site.host == host))).scalar_one_or_none()
-        if existing:
-            existing.last_score = score
-            existing.last_breakdown = breakdown
-            existing.last_level = level
-            existing.updated_at = now
-        else:
-            session.add(
-                Site(host=host, last_score=score, last_breakdown=breakdown, last_level=level, updated_at=now)
-            )
-        await session.commit()
+    # A concurrent first scoring of the same host can win the insert; retry as an update.
+    for attempt in range(2):
+        try:
+            async with SessionLocal() as session:
+                async with timed(DB_SECONDS, "site_by_host"):
+                    existing = (await session.execute(select(Site).where(Site.host == host))).scalar_one_or_none()
+                changed = existing is None or (existing.last_score, existing.last_level, existing.last_breakdown) != (
+                    score, level, breakdown
+                )
+                if existing:
+                    existing.last_score = score
+                    existing.last_breakdown = breakdown
+                    existing.last_level = level
+                    existing.updated_at = now
+                else:
+                    session.add(
+                        Site(host=host, last_score=score, last_breakdown=breakdown, last_level=level, updated_at=now)
+                    )
+                async with timed(DB_SECONDS, "signals_by_host"):
+                    row = (
+                        await session.execute(select(SiteSignals).where(SiteSignals.host == host))
+                    ).scalar_one_or_none()
+                if row:
+                    row.model_version = MODEL_VERSION
+                    row.signals = stored_signals
+                    row.updated_at = now
+                else:
+                    session.add(
+                        SiteSignals(host=host, model_version=MODEL_VERSION, signals=stored_signals, updated_at=now)
+                    )
+                async with timed(DB_SECONDS, "commit"):
+                    await session.commit()
+            break
+        except IntegrityError:
+            if attempt:
+                raise
 
     resp = {
         "host": host,
@@ -164,41 +273,68 @@ async def get_site_score(host: str):
         "votes_total": n_votes,
         "u_included": include_u,
     }
+    if changed:
+        await publish_score(resp)
+    return resp, stored_signals
+
+
+# Registered before /sites/{host} so "stream" is not taken for a host name.
+@app.get(f"{API_PREFIX}/sites/stream")
+async def stream_site_updates(
+    request: Request,
+    hosts: str = Query(..., description="Comma-separated hosts to watch"),
+    since: str | None = Query(None, description="Resume after this event ID (same as Last-Event-ID)"),
+):
+    """Server-sent events carrying a SiteScore whenever a watched host's score changes."""
+    wanted = {normalize_host(h) for h in hosts.split(",")} - {""}
+    if not wanted or len(wanted) > MAX_STREAM_HOSTS:
+        raise HTTPException(status_code=422, detail=f"hosts must list 1-{MAX_STREAM_HOSTS} hosts")
+    last_id = request.headers.get("last-event-id") or since
+    if last_id and not re.fullmatch(r"\d+(-\d+)?", last_id):
+        raise HTTPException(status_code=422, detail="invalid event id")
+    if not await get_client():
+        raise HTTPException(status_code=503, detail="change feed unavailable")
+    return StreamingResponse(
+        subscribe(wanted, last_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.get(f"{API_PREFIX}/sites/{{host}}", response_model=SiteScore)
+async def get_site_score(host: str, request: Request):
+    host = normalize_host(host)
+
+    # cache first; conditional requests are answered from it without probing
+    cached = await cache_get_json(f"site:{host}")
+    if cached:
+        return _conditional_json(request, cached, datetime.fromisoformat(cached["updated_at"]))
+
+    resp, _ = await _score_and_store(host, await _load_vote_buckets(host))
     await cache_set_json(f"site:{host}", resp)
-    return resp
+    return _conditional_json(request, resp, datetime.fromisoformat(resp["updated_at"]))
 
 
 @app.get(f"{API_PREFIX}/sites/{{host}}/explain", response_model=Explanation)
-async def get_explain(host: str):
+async def get_explain(host: str, request: Request):
+    """Signals from the latest scoring run; probes only run if the host was never scored."""
     host = normalize_host(host)
-    # votes from DB for consistent counts
     async with SessionLocal() as session:
-        res = await session.execute(select(Vote).where(Vote.host == host))
-        votes = [
-            {"label": v.label, "reason": v.reason, "ts": v.ts.isoformat()}
-            for v in res.scalars().all()
-        ]
-    u, counts = compute_u_from_votes(votes)
-    https_ok, info = await http_probe(host)
-    transp = await discover_transparency_pages(host)
-    email_auth = await dns_email_auth_probe(host)
-    dnssec = await dnssec_probe(host)
-    cert_days = await tls_expiry_days(host)
-    gsb = await google_safe_browsing_check(host)
-    seo = await seo_signals_probe(host)
+        async with timed(DB_SECONDS, "signals_by_host"):
+            row = (
+                await session.execute(select(SiteSignals).where(SiteSignals.host == host))
+            ).scalar_one_or_none()
+    if row:
+        model_version, signals, updated_at = row.model_version, row.signals, row.updated_at
+    else:
+        resp, signals = await _score_and_store(host, await _load_vote_buckets(host))
+        await cache_set_json(f"site:{host}", resp)
+        model_version, updated_at = MODEL_VERSION, datetime.fromisoformat(resp["updated_at"])
+    if updated_at.tzinfo is None:
+        updated_at = updated_at.replace(tzinfo=timezone.utc)
 
-    signals = [
-        Signal(key="https_ok", value=https_ok),
-        *[Signal(key=k, value=v) for k, v in info.items()],
-        *[Signal(key=f"transparency_{k}", value=v) for k, v in transp.items()],
-        *[Signal(key=f"email_{k}", value=v) for k, v in email_auth.items()],
-        Signal(key="tls_cert_days_to_expire", value=cert_days),
-        Signal(key="google_safe_browsing_flagged", value=gsb.get("flagged")),
-        *[Signal(key=f"seo_{k}", value=v) for k, v in seo.items()],
-        Signal(key="community_wilson", value=round(u, 2)),
-        Signal(key="votes_counts", value=counts),
-    ]
-    return Explanation(host=host, model_version="v0.3", signals=signals)
+    payload = Explanation(host=host, model_version=model_version, signals=signals).model_dump()
+    return _conditional_json(request, payload, updated_at)
 
 
 @app.post(f"{API_PREFIX}/votes", response_model=VoteResponse)
@@ -208,100 +344,54 @@ async def post_vote(payload: VoteRequest):
     now = datetime.now(timezone.utc)
     async with SessionLocal() as session:
         session.add(Vote(host=host, user_id=user, label=payload.label, reason=payload.reason, ts=now))
-        await session.commit()
+        await session.execute(vote_bucket_upsert(host, vote_day(now), payload.label))
+        async with timed(DB_SECONDS, "commit"):
+            await session.commit()
 
     # recompute
-    async with SessionLocal() as session:
-        res = await session.execute(select(Vote).where(Vote.host == host))
-        votes = [
-            {"label": v.label, "reason": v.reason, "ts": v.ts.isoformat()}
-            for v in res.scalars().all()
-        ]
-    U, counts = compute_u_from_votes(votes)
-    n_votes = sum(counts.values())
-    include_u = n_votes > 0
-    https_ok, info = await http_probe(host)
-    heur = domain_heuristics(host)
-    transp = await discover_transparency_pages(host)
-    email_auth = await dns_email_auth_probe(host)
-    dnssec = await dnssec_probe(host)
-    cert_days = await tls_expiry_days(host)
-    gsb = await google_safe_browsing_check(host)
-    seo = await seo_signals_probe(host)
-
-    S = 0.9 if https_ok else 0.5
-    if info.get("http_upgrades_https"):
-        S += 0.05
-    for key in ("csp", "hsts", "xcto", "xfo", "refpol", "permspol"):
-        if info.get(key):
-            S += 0.02
-    if dnssec.get("dnssec"):
-        S += 0.03
-    if isinstance(cert_days, int):
-        if cert_days >= 60:
-            S += 0.02
-        elif cert_days <= 7:
-            S -= 0.05
-    S = max(0.0, min(1.0, S))
-
-    C = heur["credibility"]
-    if gsb.get("flagged"):
-        C = max(0.0, C - 0.3)
-    seo_bonuses = [
-        seo.get("has_title"), seo.get("has_meta_description"), seo.get("has_canonical"),
-        seo.get("has_open_graph"), seo.get("has_jsonld"), seo.get("has_robots"), seo.get("has_sitemap")
-    ]
-    C = min(1.0, C + 0.01 * sum(1 for b in seo_bonuses if b))
-
-    t_hits = sum(1 for v in transp.values() if v)
-    t_hits += sum(1 for k, v in email_auth.items() if k in ("spf", "dmarc", "mx") and v)
-    strong = 0
-    if email_auth.get("dmarc_policy") in ("reject", "quarantine"):
-        strong += 1
-    if email_auth.get("spf_strict"):
-        strong += 1
-    t_hits += strong
-    T = min(1.0, 0.4 + 0.1 * t_hits)
-
-    if include_u:
-        ramp_n = int(os.getenv("COMMUNITY_RAMP_N", "10") or 10)
-        baseline = float(os.getenv("COMMUNITY_BASELINE", "0.5") or 0.5)
-        U_adj, u_factor = compute_u_adjusted(U, n_votes, baseline=baseline, ramp_n=ramp_n)
-        breakdown = {"S": S, "C": C, "T": T, "U": U_adj}
-        new_score = compose_score_weighted(S, C, T, U_adj, u_factor)
-    else:
-        breakdown = {"S": S, "C": C, "T": T, "U": 0.0}
-        new_score = compose_score_dynamic(S, C, T, U, include_u)
-
-    async with SessionLocal() as session:
-        existing = (await session.execute(select(Site).where(Site.host == host))).scalar_one_or_none()
-        if existing:
-            existing.last_score = new_score
-            existing.last_breakdown = breakdown
-            existing.last_level = classify_level(new_score)
-            existing.updated_at = now
-        else:
-            session.add(
-                Site(
-                    host=host,
-                    last_score=new_score,
-                    last_breakdown=breakdown,
-                    last_level=classify_level(new_score),
-                    updated_at=now,
-                )
-            )
-        await session.commit()
+    resp, _ = await _score_and_store(host, await _load_vote_buckets(host))
 
     # invalidate cache by overwriting small TTL
     await cache_set_json(f"site:{host}", None, ttl=1)
-    return VoteResponse(ok=True, new_score=new_score)
+    return VoteResponse(ok=True, new_score=resp["score"])
+
+
+@app.get(f"{API_PREFIX}/metrics", include_in_schema=False)
+async def metrics():
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
 
 
 @app.get(f"{API_PREFIX}/health")
-async def health():
-    return {
+async def health(ready: bool = False):
+    """Liveness by default; ?ready=true also checks the database (and reports Redis).
+
+    The schema is applied by `python -m app.migrate`, not at start-up, so a
+    replica is live immediately and becomes ready once the DB is reachable.
+    """
+    body = {
         "ok": True,
         "service": "api",
     "version": "v0.11",
         "time": datetime.now(timezone.utc).isoformat(),
     }
+    if not ready:
+        return body
+    checks = {}
+    try:
+        await check_db()
+        checks["db"] = "ok"
+    except Exception as e:
+        checks["db"] = f"error: {type(e).__name__}"
+    client = await get_client()
+    if client is None:
+        checks["cache"] = "disabled"
+    else:
+        try:
+            await asyncio.wait_for(client.ping(), 1.0)
+            checks["cache"] = "ok"
+        except Exception as e:
+            # Redis is optional: degraded, not unready
+            checks["cache"] = f"error: {type(e).__name__}"
+    body["checks"] = checks
+    body["ok"] = checks["db"] == "ok"
+    return JSONResponse(body, status_code=200 if body["ok"] else 503)
@@ -0,0 +1,172 @@
+from __future__ import annotations
+import contextvars
+import functools
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# Minimal in-process Prometheus metrics (text exposition format 0.0.4).
+# Each API/worker process exposes its own series; scrape every replica.
+
+SERVER_TIMING = os.getenv("SERVER_TIMING", "0").lower() in ("1", "true", "yes")
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0)
+
+# Per-request (name, seconds) entries collected for the Server-Timing header.
+_timings: contextvars.ContextVar[Optional[List[Tuple[str, float]]]] = contextvars.ContextVar(
+    "ost_timings", default=None
+)
+
+_registry: List["_Metric"] = []
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, doc: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.doc = doc
+        self.labelnames = tuple(labelnames)
+        _registry.append(self)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, doc: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, doc, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def render(self) -> List[str]:
+        out = super().render()
+        for labels, v in sorted(self._values.items()):
+            out.append(f"{self.name}{_labels(self.labelnames, labels)} {v}")
+        return out
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, doc: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, doc, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> (per-bucket counts, sum, count)
+        self._values: Dict[Tuple[str, ...], Tuple[List[int], float, int]] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        counts, total, n = self._values.get(labels) or ([0] * len(self.buckets), 0.0, 0)
+        for i, b in enumerate(self.buckets):
+            if value <= b:
+                counts[i] += 1
+                break
+        self._values[labels] = (counts, total + value, n + 1)
+
+    def render(self) -> List[str]:
+        out = super().render()
+        for labels, (counts, total, n) in sorted(self._values.items()):
+            cum = 0
+            for b, c in zip(self.buckets, counts):
+                cum += c
+                le = 'le="%s"' % b
+                out.append(f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cum}")
+            le = 'le="+Inf"'
+            out.append(f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {n}")
+            out.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {total}")
+            out.append(f"{self.name}_count{_labels(self.labelnames, labels)} {n}")
+        return out
+
+
+REQUEST_SECONDS = Histogram("ost_http_request_duration_seconds", "API request latency.", ["method", "route", "status"])
+PROBE_SECONDS = Histogram("ost_probe_duration_seconds", "Wall time of each probe.", ["probe"])
+OUTBOUND_TOTAL = Counter(
+    "ost_outbound_requests_total",
+    "Outbound probe requests by kind and outcome (ok, timeout, connect_error, dns_error, tls_error, circuit_open, rate_limited or error class).",
+    ["kind", "outcome"],
+)
+CACHE_TOTAL = Counter(
+    "ost_cache_requests_total", "Cache lookups by key prefix and result (hit, miss, error).", ["prefix", "result"]
+)
+CACHE_SECONDS = Histogram("ost_cache_duration_seconds", "Redis cache call latency.", ["op"])
+DB_SECONDS = Histogram("ost_db_query_duration_seconds", "Database query latency.", ["query"])
+
+
+def outcome_of(exc: Optional[BaseException]) -> str:
+    """Map an exception from an outbound call to a low-cardinality outcome label."""
+    if exc is None:
+        return "ok"
+    name = type(exc).__name__
+    if "Timeout" in name or isinstance(exc, TimeoutError):
+        return "timeout"
+    if "Connect" in name or isinstance(exc, ConnectionError):
+        return "connect_error"
+    return name
+
+
+def start_request_timings() -> List[Tuple[str, float]]:
+    """Begin collecting Server-Timing entries for the current request."""
+    entries: List[Tuple[str, float]] = []
+    _timings.set(entries)
+    return entries
+
+
+def server_timing_header(entries: List[Tuple[str, float]]) -> str:
+    agg: Dict[str, float] = {}
+    for name, secs in entries:
+        agg[name] = agg.get(name, 0.0) + secs
+    return ", ".join(f"{name};dur={secs * 1000:.1f}" for name, secs in agg.items())
+
+
+def _record(hist: Histogram, timing_name: str, elapsed: float, labels: Tuple[str, ...]) -> None:
+    hist.observe(elapsed, *labels)
+    entries = _timings.get()
+    if entries is not None:
+        entries.append((timing_name, elapsed))
+
+
+@asynccontextmanager
+async def timed(hist: Histogram, *labels: str):
+    """Observe the block's duration in hist and add it to the request's Server-Timing."""
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        _record(hist, "_".join((hist.name.split("_")[1],) + labels), time.perf_counter() - t0, labels)
+
+
+def instrument_probe(name: str):
+    """Decorator recording an async probe's latency under probe=name."""
+
+    def deco(fn):
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            async with timed(PROBE_SECONDS, name):
+                return await fn(*args, **kwargs)
+
+        return wrapper
+
+    return deco
+
+
+def render() -> str:
+    lines: List[str] = []
+    for m in _registry:
+        lines.extend(m.render())
+    return "\n".join(lines) + "\n"
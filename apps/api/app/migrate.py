@@ -0,0 +1,21 @@
+"""Apply the database schema and one-off data backfills.
+
+Run once per deploy before starting API replicas or the worker:
+
+    python -m app.migrate
+
+Safe to re-run; run it again once a rolling deploy has replaced every old
+replica so votes they recorded without buckets are counted.
+"""
+import asyncio
+
+from .db import init_db
+
+
+def main() -> None:
+    asyncio.run(init_db())
+    print("Database schema is up to date.")
+
+
+if __name__ == "__main__":
+    main()
@@ -6,17 +6,90 @@ import socket
 from datetime import datetime, timezone
 import asyncio
 
-# optional dependency: dnspython
-dns = None
-try:  # pragma: no cover - best effort
-    import dns.resolver  # type: ignore
-    dns = dns  # type: ignore  # keep module binding for truthy check
-except Exception:
-    dns = None
+# optional dependency: dnspython, imported on first DNS probe to keep
+# API start-up cheap
+_dns_module = None
+_dns_loaded = False
+
+
+def _dns():
+    """Return the dnspython package (with resolver loaded), or None if unavailable."""
+    global _dns_module, _dns_loaded
+    if not _dns_loaded:
+        try:  # pragma: no cover - best effort
+            import dns.resolver  # type: ignore
+            _dns_module = dns
+        except Exception:
+            _dns_module = None
+        _dns_loaded = True
+    return _dns_module
 
 import os
+import codecs
 import urllib.parse
-from bs4 import BeautifulSoup  # type: ignore
+import zlib
+from html.parser import HTMLParser
+
+from . import breaker
+from .metrics import OUTBOUND_TOTAL, instrument_probe, outcome_of
+from .ratelimit import acquire
+
+# Upper bound on decoded homepage bytes read by seo_signals_probe. Bodies are
+# read raw and inflated with a bounded output size (see _aiter_capped), so this
+# bounds peak memory per probe regardless of page size or compression ratio.
+SEO_MAX_BYTES = int(os.getenv("SEO_MAX_BYTES", str(256 * 1024)))
+SEO_CHUNK_BYTES = 16 * 1024
+# Ask origins not to compress capped reads; _aiter_capped still copes if they do.
+_IDENTITY = {"Accept-Encoding": "identity"}
+
+
+def _port(url: httpx.URL) -> int:
+    return url.port or (443 if url.scheme == "https" else 80)
+
+
+async def _request_hook(request: httpx.Request) -> None:
+    if await breaker.is_open(request.url.host, _port(request.url)):
+        OUTBOUND_TOTAL.inc("http", "circuit_open")
+        raise httpx.ConnectError("host recently unreachable (circuit open)", request=request)
+    # Hooks run outside httpx's timeouts; queue for tokens no longer than the pool timeout.
+    max_wait = (request.extensions.get("timeout") or {}).get("pool")
+    try:
+        acquired = await acquire(request.url.host, max_wait)
+    except socket.gaierror as e:
+        OUTBOUND_TOTAL.inc("http", "dns_error")
+        raise httpx.ConnectError(f"name resolution failed: {e}", request=request) from e
+    if not acquired:
+        OUTBOUND_TOTAL.inc("http", "rate_limited")
+        raise httpx.PoolTimeout("rate limit wait exceeded the pool timeout", request=request)
+
+
+class _GuardedTransport(httpx.AsyncHTTPTransport):
+    """Transport that opens the host circuit breaker on DNS/connect failures
+    (not on TLS failures, where the host is up)."""
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        try:
+            resp = await super().handle_async_request(request)
+        except (httpx.ConnectError, httpx.ConnectTimeout) as e:
+            if breaker.is_tls_failure(e):
+                OUTBOUND_TOTAL.inc("http", "tls_error")
+                raise
+            OUTBOUND_TOTAL.inc("http", outcome_of(e))
+            await breaker.record_exception(request.url.host, _port(request.url), e)
+            raise
+        except Exception as e:
+            OUTBOUND_TOTAL.inc("http", outcome_of(e))
+            raise
+        OUTBOUND_TOTAL.inc("http", "ok")
+        return resp
+
+
+def _client(**kwargs) -> httpx.AsyncClient:
+    """AsyncClient whose every request (redirects included) is checked against the
+    host circuit breaker and passes the shared rate limiter."""
+    return httpx.AsyncClient(
+        event_hooks={"request": [_request_hook]}, transport=_GuardedTransport(), **kwargs
+    )
 
 
 def _extract_gsb_key(value: str | None) -> str | None:
@@ -42,6 +115,7 @@ def _extract_gsb_key(value: str | None) -> str | None:
     return v
 
 
+@instrument_probe("safe_browsing")
 async def google_safe_browsing_check(host: str) -> Dict[str, bool]:
     """Optional Google Safe Browsing v4 check (site-level heuristic).
     Requires env GOOGLE_SAFE_BROWSING_API_KEY. Returns { flagged: bool }.
@@ -60,7 +134,7 @@ async def google_safe_browsing_check(host: str) -> Dict[str, bool]:
         },
     }
     try:
-        async with httpx.AsyncClient(timeout=6) as client:
+        async with _client(timeout=6) as client:
             r = await client.post(url, json=body)
             if r.status_code == 200:
                 j = r.json()
@@ -70,8 +144,117 @@ async def google_safe_browsing_check(host: str) -> Dict[str, bool]:
     return {"flagged": False}
 
 
+class _HeadSignalParser(HTMLParser):
+    """Incremental tokenizer that records SEO signals found in <head>.
+
+    Fed chunk by chunk; sets ``done`` once </head> (or <body>) is reached or
+    every signal has been decided, so the caller can stop reading the body.
+    """
+
+    KEYS = ("has_title", "has_meta_description", "has_meta_robots", "has_canonical", "has_open_graph", "has_jsonld")
+
+    def __init__(self) -> None:
+        super().__init__(convert_charrefs=True)
+        self.found: Dict[str, bool] = {k: False for k in self.KEYS}
+        self.done = False
+        self._capture: str | None = None  # "title" / "jsonld" while inside those elements
+
+    def _mark(self, key: str) -> None:
+        self.found[key] = True
+        if all(self.found.values()):
+            self.done = True
+
+    def handle_starttag(self, tag, attrs):
+        if self.done:
+            return
+        if tag == "body":
+            self.done = True
+            return
+        a = {k.lower(): (v or "") for k, v in attrs}
+        if tag == "title":
+            self._capture = "title"
+        elif tag == "meta":
+            name = a.get("name", "").lower()
+            content = a.get("content", "").strip()
+            if content:
+                if name == "description":
+                    self._mark("has_meta_description")
+                elif name == "robots":
+                    self._mark("has_meta_robots")
+                elif a.get("property", "").lower() == "og:title":
+                    self._mark("has_open_graph")
+        elif tag == "link":
+            if "canonical" in a.get("rel", "").lower().split() and a.get("href"):
+                self._mark("has_canonical")
+        elif tag == "script" and a.get("type", "").lower() == "application/ld+json":
+            self._capture = "jsonld"
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+
+    def handle_endtag(self, tag):
+        if tag == "head":
+            self.done = True
+        elif tag in ("title", "script"):
+            self._capture = None
+
+    def handle_data(self, data):
+        if self._capture and data.strip():
+            self._mark("has_title" if self._capture == "title" else "has_jsonld")
+
+
+async def _aiter_capped(r: httpx.Response, limit: int):
+    """Yield decoded body chunks of a streamed response, at most limit bytes in total.
+
+    Reads raw bytes and inflates gzip/deflate with a bounded output size, so a
+    small compressed body cannot expand past limit in memory (httpx's
+    aiter_bytes inflates each network read in full). Other content codings
+    yield nothing.
+    """
+    enc = r.headers.get("content-encoding", "").strip().lower()
+    if enc in ("", "identity"):
+        inflater = None
+    elif enc in ("gzip", "x-gzip", "deflate"):
+        inflater = zlib.decompressobj(32 + zlib.MAX_WBITS)  # auto-detect gzip/zlib header
+    else:
+        return
+    left = limit
+    async for raw in r.aiter_raw(SEO_CHUNK_BYTES):
+        if inflater is None:
+            out = raw[:left]
+        else:
+            try:
+                out = inflater.decompress(raw, left)
+            except zlib.error:
+                return
+        if out:
+            left -= len(out)
+            yield out
+        if left <= 0:
+            return
+
+
+async def _url_has_body(client: httpx.AsyncClient, url: str) -> bool:
+    """True when url answers 200 with a non-empty body; reads at most one chunk."""
+    try:
+        async with client.stream("GET", url, headers=_IDENTITY) as r:
+            if r.status_code != 200:
+                return False
+            async for chunk in _aiter_capped(r, SEO_CHUNK_BYTES):
+                if chunk:
+                    return True
+    except Exception:
+        pass
+    return False
+
+
+@instrument_probe("seo")
 async def seo_signals_probe(host: str) -> Dict[str, bool]:
-    """Lightweight SEO presence signals: title, meta description, canonical, robots.txt, robots meta, OG, JSON-LD, sitemap.xml."""
+    """Lightweight SEO presence signals: title, meta description, canonical, robots.txt, robots meta, OG, JSON-LD, sitemap.xml.
+
+    The homepage is streamed and tokenized incrementally up to SEO_MAX_BYTES;
+    reading stops at </head> or as soon as all head signals are found.
+    """
     out: Dict[str, bool] = {
         "has_title": False,
         "has_meta_description": False,
@@ -83,47 +266,30 @@ async def seo_signals_probe(host: str) -> Dict[str, bool]:
         "has_sitemap": False,
     }
     try:
-        async with httpx.AsyncClient(follow_redirects=True, timeout=6) as client:
-            r = await client.get(f"https://{host}")
-            html = r.text
-            soup = BeautifulSoup(html, "html.parser")
-            title = soup.find("title")
-            if title and title.text.strip():
-                out["has_title"] = True
-            meta_desc = soup.find("meta", attrs={"name": "description"})
-            if meta_desc and meta_desc.get("content"):
-                out["has_meta_description"] = True
-            meta_robots = soup.find("meta", attrs={"name": "robots"})
-            if meta_robots and meta_robots.get("content"):
-                out["has_meta_robots"] = True
-            link_canonical = soup.find("link", attrs={"rel": "canonical"})
-            if link_canonical and link_canonical.get("href"):
-                out["has_canonical"] = True
-            # Open Graph
-            og_title = soup.find("meta", attrs={"property": "og:title"})
-            if og_title and og_title.get("content"):
-                out["has_open_graph"] = True
-            # JSON-LD schema.org
-            jsonld = soup.find("script", attrs={"type": "application/ld+json"})
-            if jsonld and jsonld.text.strip():
-                out["has_jsonld"] = True
-            # robots.txt
+        async with _client(follow_redirects=True, timeout=6) as client:
+            parser = _HeadSignalParser()
             try:
-                r2 = await client.get(f"https://{host}/robots.txt")
-                out["has_robots"] = r2.status_code == 200 and len(r2.text) > 0
-            except Exception:
-                pass
-            # sitemap.xml
-            try:
-                r3 = await client.get(f"https://{host}/sitemap.xml")
-                out["has_sitemap"] = r3.status_code == 200 and len(r3.text) > 0
+                async with client.stream("GET", f"https://{host}", headers=_IDENTITY) as r:
+                    try:
+                        decoder = codecs.getincrementaldecoder(r.charset_encoding or "utf-8")(errors="replace")
+                    except LookupError:
+                        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+                    async for chunk in _aiter_capped(r, SEO_MAX_BYTES):
+                        parser.feed(decoder.decode(chunk))
+                        if parser.done:
+                            break
+                parser.close()
             except Exception:
                 pass
+            out.update(parser.found)
+            out["has_robots"] = await _url_has_body(client, f"https://{host}/robots.txt")
+            out["has_sitemap"] = await _url_has_body(client, f"https://{host}/sitemap.xml")
     except Exception:
         pass
     return out
 
 
+@instrument_probe("http")
 async def http_probe(host: str) -> Tuple[bool, dict]:
     """Fetch over HTTPS and HTTP, collect security headers and upgrade info.
     Returns (https_ok, info)
@@ -146,7 +312,7 @@ async def http_probe(host: str) -> Tuple[bool, dict]:
     }
     https_ok = False
     try:
-        async with httpx.AsyncClient(follow_redirects=True, timeout=8) as client:
+        async with _client(follow_redirects=True, timeout=8) as client:
             r = await client.get(url_https)
             info["https_ok"] = True
             info["status"] = r.status_code
@@ -163,7 +329,7 @@ async def http_probe(host: str) -> Tuple[bool, dict]:
         https_ok = False
 
     try:
-        async with httpx.AsyncClient(follow_redirects=True, timeout=8) as client:
+        async with _client(follow_redirects=True, timeout=8) as client:
             r = await client.get(url_http)
             info["http_ok"] = True
             # Detect upgrade: if final URL scheme is https
@@ -179,6 +345,7 @@ async def http_probe(host: str) -> Tuple[bool, dict]:
     return https_ok, info
 
 
+@instrument_probe("transparency")
 async def discover_transparency_pages(host: str) -> Dict[str, bool]:
     """Best-effort checks for transparency pages.
     Returns flags for privacy, terms, about, contact, security_txt, humans_txt.
@@ -198,7 +365,7 @@ async def discover_transparency_pages(host: str) -> Dict[str, bool]:
     ]}
     base = f"https://{host}"
     try:
-        async with httpx.AsyncClient(follow_redirects=True, timeout=6) as client:
+        async with _client(follow_redirects=True, timeout=6) as client:
             # well-known first
             try:
                 r = await client.get(base + "/.well-known/security.txt")
@@ -253,25 +420,45 @@ def domain_heuristics(host: str) -> Dict[str, float]:
     return {"credibility": score_c}
 
 
+async def _dns_resolve(name: str, rdtype: str):
+    """Rate-limited dnspython query that records its outcome; re-raises errors."""
+    dns = _dns()
+    if not await acquire(max_wait=3.0):
+        OUTBOUND_TOTAL.inc("dns", "rate_limited")
+        raise TimeoutError("rate limit wait exceeded the DNS lifetime")
+    try:
+        ans = dns.resolver.resolve(name, rdtype, lifetime=3.0)
+    except Exception as e:
+        OUTBOUND_TOTAL.inc("dns", outcome_of(e))
+        raise
+    OUTBOUND_TOTAL.inc("dns", "ok")
+    return ans
+
+
 async def _resolve_txt(domain: str) -> list[str]:
-    if not dns:
+    if not _dns():
         return []
     try:
-        res = dns.resolver.resolve(domain, 'TXT', lifetime=3.0)
+        res = await _dns_resolve(domain, 'TXT')
         return [b"".join(r.strings).decode('utf-8', 'ignore') for r in res]  # type: ignore
     except Exception:
         return []
 
 
+@instrument_probe("email_auth")
 async def dns_email_auth_probe(host: str) -> Dict[str, bool]:
     """Check SPF for apex, DMARC at _dmarc, and MX records. Also provide dmarc_policy and spf_strict flags."""
     out: Dict[str, bool | str] = {"spf": False, "dmarc": False, "mx": False, "dmarc_policy": "", "spf_strict": False}
-    if not dns:
+    dns = _dns()
+    if not dns or await breaker.is_open(host):
         return out
     # MX
     try:
-        ans = dns.resolver.resolve(host, 'MX', lifetime=3.0)
+        ans = await _dns_resolve(host, 'MX')
         out["mx"] = len(ans) > 0
+    except dns.resolver.NXDOMAIN:
+        await breaker.record_failure(host, None, "nxdomain")
+        return out
     except Exception:
         out["mx"] = False
     # SPF at apex
@@ -298,25 +485,48 @@ async def dns_email_auth_probe(host: str) -> Dict[str, bool]:
     return out
 
 
+@instrument_probe("dnssec")
 async def dnssec_probe(host: str) -> Dict[str, bool]:
     """Check for presence of DS records indicating DNSSEC at the zone apex."""
-    if not dns:
+    dns = _dns()
+    if not dns or await breaker.is_open(host):
         return {"dnssec": False}
     try:
-        ans = dns.resolver.resolve(host, 'DS', lifetime=3.0)
+        ans = await _dns_resolve(host, 'DS')
         return {"dnssec": len(ans) > 0}
+    except dns.resolver.NXDOMAIN:
+        await breaker.record_failure(host, None, "nxdomain")
+        return {"dnssec": False}
     except Exception:
         return {"dnssec": False}
 
 
+@instrument_probe("tls")
 async def tls_expiry_days(host: str, port: int = 443) -> int | None:
     """Return days until certificate expiry, or None on failure."""
+    if await breaker.is_open(host, port):
+        return None
     try:
+        if not await acquire(host, max_wait=5):
+            OUTBOUND_TOTAL.inc("tls", "rate_limited")
+            return None
         ctx = ssl.create_default_context()
         ctx.check_hostname = False
         ctx.verify_mode = ssl.CERT_NONE
-        with socket.create_connection((host, port), timeout=5) as sock:
-            with ctx.wrap_socket(sock, server_hostname=host) as ssock:
+        try:
+            sock = socket.create_connection((host, port), timeout=5)
+        except OSError as e:
+            OUTBOUND_TOTAL.inc("tls", outcome_of(e))
+            await breaker.record_exception(host, port, e)
+            return None
+        with sock:
+            try:
+                ssock = ctx.wrap_socket(sock, server_hostname=host)
+            except Exception as e:
+                OUTBOUND_TOTAL.inc("tls", outcome_of(e))
+                raise
+            OUTBOUND_TOTAL.inc("tls", "ok")
+            with ssock:
                 cert = ssock.getpeercert()
                 not_after = cert.get('notAfter')
                 if not_after:
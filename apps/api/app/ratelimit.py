@@ -0,0 +1,165 @@
+from __future__ import annotations
+import asyncio
+import ipaddress
+import os
+import random
+import socket
+import time
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+from . import breaker
+from .cache import get_client
+
+# Token buckets shared by every API/worker process through Redis.
+# Each bucket refills at *_RPS tokens/second up to *_BURST tokens.
+RATE_GLOBAL_RPS = float(os.getenv("RATE_GLOBAL_RPS", "50"))
+RATE_GLOBAL_BURST = float(os.getenv("RATE_GLOBAL_BURST", "100"))
+RATE_DOMAIN_RPS = float(os.getenv("RATE_DOMAIN_RPS", "10"))
+RATE_DOMAIN_BURST = float(os.getenv("RATE_DOMAIN_BURST", "20"))
+RATE_IP_RPS = float(os.getenv("RATE_IP_RPS", "10"))
+RATE_IP_BURST = float(os.getenv("RATE_IP_BURST", "20"))
+# Longest a caller queues for tokens by default; acquire() then gives up.
+RATE_MAX_WAIT_SECONDS = float(os.getenv("RATE_MAX_WAIT_SECONDS", "10"))
+RESOLVE_TTL_SECONDS = 60
+# Cap on in-process resolved-IP entries (oldest evicted first).
+RESOLVE_CACHE_MAX = 10000
+
+# Refill every bucket in KEYS, then take one token from all of them or none.
+# ARGV holds (rate, burst) pairs in KEYS order. Returns "0" when acquired,
+# otherwise the seconds to wait (as a string; Lua numbers are truncated).
+_ACQUIRE_LUA = """
+local now = redis.call('TIME')
+local t = tonumber(now[1]) + tonumber(now[2]) / 1000000
+local wait = 0
+local tokens = {}
+for i, key in ipairs(KEYS) do
+  local rate = tonumber(ARGV[2 * i - 1])
+  local burst = tonumber(ARGV[2 * i])
+  local b = redis.call('HMGET', key, 'tokens', 'ts')
+  local tk = tonumber(b[1]) or burst
+  local ts = tonumber(b[2]) or t
+  tk = math.min(burst, tk + math.max(0, t - ts) * rate)
+  tokens[i] = tk
+  if tk < 1 then
+    wait = math.max(wait, (1 - tk) / rate)
+  end
+end
+if wait > 0 then
+  return tostring(wait)
+end
+for i, key in ipairs(KEYS) do
+  local rate = tonumber(ARGV[2 * i - 1])
+  local burst = tonumber(ARGV[2 * i])
+  redis.call('HSET', key, 'tokens', tokens[i] - 1, 'ts', t)
+  redis.call('EXPIRE', key, math.ceil(burst / rate) + 1)
+end
+return '0'
+"""
+
+_script = None
+# host -> (ip, expires); insertion order == expiry order since the TTL is fixed
+_resolved: "OrderedDict[str, Tuple[Optional[str], float]]" = OrderedDict()
+
+# Second-level labels under which registrations happen one level deeper
+# (e.g. example.co.uk). A heuristic stand-in for the public suffix list.
+_SHARED_SLDS = {"co", "com", "net", "org", "gov", "edu", "ac", "or", "ne", "go"}
+
+
+def registrable_domain(host: str) -> str:
+    """Best-effort eTLD+1 for host (example.co.uk, example.com)."""
+    h = (host or "").lower().rstrip(".")
+    parts = h.split(".")
+    if len(parts) <= 2 or _is_ip(h):
+        return h
+    if parts[-2] in _SHARED_SLDS and len(parts[-1]) == 2:
+        return ".".join(parts[-3:])
+    return ".".join(parts[-2:])
+
+
+def _is_ip(value: str) -> bool:
+    try:
+        ipaddress.ip_address(value)
+        return True
+    except ValueError:
+        return False
+
+
+async def resolve_ip(host: str) -> Optional[str]:
+    """First resolved address for host, cached in-process for a short while.
+
+    A name that does not resolve opens the host circuit breaker and re-raises
+    socket.gaierror, so the request fails now instead of paying the same DNS
+    failure again inside httpx. Other errors just yield None.
+    """
+    if _is_ip(host):
+        return host
+    hit = _resolved.get(host)
+    if hit and hit[1] > time.monotonic():
+        return hit[0]
+    ip = None
+    failure: Optional[socket.gaierror] = None
+    try:
+        infos = await asyncio.get_running_loop().getaddrinfo(host, None, type=socket.SOCK_STREAM)
+        if infos:
+            ip = infos[0][4][0]
+    except socket.gaierror as e:
+        failure = e
+    except Exception:
+        ip = None
+    now = time.monotonic()
+    _resolved.pop(host, None)
+    _resolved[host] = (ip, now + RESOLVE_TTL_SECONDS)
+    while _resolved:
+        oldest, (_, expires) = next(iter(_resolved.items()))
+        if expires > now and len(_resolved) <= RESOLVE_CACHE_MAX:
+            break
+        del _resolved[oldest]
+    if failure is not None:
+        await breaker.record_failure(host, None, "dns")
+        raise failure
+    return ip
+
+
+async def _buckets(host: Optional[str]) -> Tuple[List[str], List[float]]:
+    keys = ["rl:global"]
+    args = [RATE_GLOBAL_RPS, RATE_GLOBAL_BURST]
+    if host:
+        keys.append(f"rl:dom:{registrable_domain(host)}")
+        args += [RATE_DOMAIN_RPS, RATE_DOMAIN_BURST]
+        ip = await resolve_ip(host)
+        if ip:
+            keys.append(f"rl:ip:{ip}")
+            args += [RATE_IP_RPS, RATE_IP_BURST]
+    return keys, args
+
+
+async def acquire(host: Optional[str] = None, max_wait: Optional[float] = None) -> bool:
+    """Wait until one outbound request toward host may be sent.
+
+    Always draws from the global bucket; with a host, also from its
+    registrable-domain and resolved-IP buckets. Over-limit callers sleep
+    until tokens refill, for at most max_wait seconds (default
+    RATE_MAX_WAIT_SECONDS); returns False when the tokens would not arrive in
+    time. Raises socket.gaierror when host does not resolve (see resolve_ip).
+    Without Redis this is a no-op.
+    """
+    global _script
+    client = await get_client()
+    if not client:
+        return True
+    deadline = time.monotonic() + (RATE_MAX_WAIT_SECONDS if max_wait is None else max_wait)
+    keys, args = await _buckets(host)
+    while True:
+        try:
+            if _script is None:
+                _script = client.register_script(_ACQUIRE_LUA)
+            wait = float(await _script(keys=keys, args=args))
+        except Exception:
+            return True
+        if wait <= 0:
+            return True
+        wait += random.uniform(0, 0.05)
+        if time.monotonic() + wait > deadline:
+            return False
+        await asyncio.sleep(wait)
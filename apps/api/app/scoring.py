@@ -1,4 +1,6 @@
 import math
+import os
+from datetime import date
 from typing import List, Dict, Tuple
 
 LABEL_SAFE = "safe"
@@ -29,7 +31,7 @@ def compose_score_dynamic(S: float, C: float, T: float, U: float, include_u: boo
     return round(sigmoid(3 * z - 1.5) * 100, 1)
 
 
-def compute_u_adjusted(u_raw: float, n_votes: int, baseline: float = 0.5, ramp_n: int = 10) -> Tuple[float, float]:
+def compute_u_adjusted(u_raw: float, n_votes: float, baseline: float = 0.5, ramp_n: int = 10) -> Tuple[float, float]:
     """Blend community U toward a neutral baseline when votes are few, and return a ramp factor.
 
     Returns (u_adjusted, u_factor) where u_factor in [0,1] can be used to scale U's weight.
@@ -99,6 +101,47 @@ def compute_u_from_votes(votes: List[Dict]) -> Tuple[float, Dict[str, int]]:
     return u, counts
 
 
+# Age at which a community vote carries half its original weight.
+VOTE_HALF_LIFE_DAYS = float(os.getenv("VOTE_HALF_LIFE_DAYS", "180") or 180)
+
+
+def decay_weight(age_days: float, half_life_days: float) -> float:
+    """Exponential decay: a vote half_life_days old counts half as much as today's."""
+    if half_life_days <= 0:
+        return 1.0
+    return 0.5 ** (max(0.0, age_days) / half_life_days)
+
+
+def compute_u_from_buckets(
+    buckets: List[Dict], today: date, half_life_days: float = VOTE_HALF_LIFE_DAYS
+) -> Tuple[float, Dict[str, int], float]:
+    """Decayed Wilson lower bound from daily vote buckets, in O(buckets).
+
+    buckets: [{"day": date, "label": str, "count": int}, ...]. Each bucket's
+    count is weighted by decay_weight of its age, suspicious counting half
+    positive as in compute_u_from_votes. Returns (U, raw counts_by_label,
+    decayed vote total); pass the decayed total to compute_u_adjusted so the
+    ramp fades along with the votes.
+    """
+    counts = {LABEL_SAFE: 0, LABEL_SUSPICIOUS: 0, LABEL_DANGER: 0}
+    pos = 0.0
+    n = 0.0
+    for b in buckets:
+        label = b.get("label")
+        if label not in counts:
+            continue
+        c = int(b.get("count") or 0)
+        counts[label] += c
+        w = c * decay_weight((today - b["day"]).days, half_life_days)
+        n += w
+        if label == LABEL_SAFE:
+            pos += w
+        elif label == LABEL_SUSPICIOUS:
+            pos += 0.5 * w
+    u = wilson_lower_bound(pos, n) if n > 0 else 0.5
+    return u, counts, n
+
+
 def compute_breakdown(votes: List[Dict]) -> Dict[str, float]:
     # TODO: Replace S/C/T placeholders with real signals extraction.
     # For MVP bootstrap, assume moderately safe defaults.
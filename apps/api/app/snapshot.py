@@ -0,0 +1,297 @@
+"""Bulk snapshots of the sites table for offline lookups.
+
+A snapshot file is a little-endian, column-oriented table sorted bytewise by
+host, so clients can mmap it and binary-search without any API call:
+
+    header   40 bytes  magic b"OSTS", u16 format, u8 kind (0 full, 1 delta),
+                       u8 flags (bit 0: signed), u32 count, u64 seq,
+                       u64 base_seq, u64 created_at (unix s), u32 reserved
+    offsets  u32 * (count + 1)   start of each host in the host blob
+    updated  u32 * count         unix seconds
+    score    u16 * count         score * 10
+    S, C, T, U  u16 * count each component * 10000
+    level    u8 * count          0 green, 1 amber, 2 red
+    hosts    utf-8 blob
+    trailer  64 bytes            Ed25519 signature of everything before it
+                                 (zeros when unsigned)
+
+A delta holds complete rows for hosts updated since the previous snapshot
+(full or delta); readers consult deltas newest first, then the full.
+
+manifest.json is {"payload": "<json string>", "signature": "<hex>"|null}. The
+payload lists the current full, its deltas and their sha256 digests; the
+signature is Ed25519 over the payload string's UTF-8 bytes. Clients must pin the
+public key out of band and verify with it (see read_manifest); the
+"public_key" field inside the payload is informational only, since whoever can
+rewrite the manifest could also swap it. Files replaced by a new full stay
+available for SNAPSHOT_RETAIN_SECONDS so clients holding the previous
+manifest can finish downloading.
+"""
+from __future__ import annotations
+import hashlib
+import json
+import mmap
+import os
+import struct
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+from sqlalchemy import select
+
+from .db import SessionLocal, Site
+
+# optional dependency: cryptography (Ed25519 signatures)
+try:  # pragma: no cover - best effort
+    from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey, Ed25519PublicKey  # type: ignore
+except Exception:
+    Ed25519PrivateKey = None  # type: ignore
+    Ed25519PublicKey = None  # type: ignore
+
+SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR", "/data/snapshots")
+# Hex-encoded 32-byte Ed25519 private key seed; snapshots are unsigned without it.
+SNAPSHOT_SIGNING_KEY = os.getenv("SNAPSHOT_SIGNING_KEY", "")
+SNAPSHOT_MAX_DELTAS = int(os.getenv("SNAPSHOT_MAX_DELTAS", "24"))
+SNAPSHOT_INTERVAL_SECONDS = int(os.getenv("SNAPSHOT_INTERVAL_SECONDS", "3600"))
+# Grace period before files dropped from the manifest are deleted.
+SNAPSHOT_RETAIN_SECONDS = int(os.getenv("SNAPSHOT_RETAIN_SECONDS", str(SNAPSHOT_INTERVAL_SECONDS)))
+# Deltas start this long before the previous snapshot's query time to cover
+# transactions that were still in flight when it ran.
+SNAPSHOT_OVERLAP_SECONDS = 60
+
+MAGIC = b"OSTS"
+FORMAT_VERSION = 1
+KIND_FULL = 0
+KIND_DELTA = 1
+FLAG_SIGNED = 1
+HEADER = struct.Struct("<4sHBBIQQQI")
+SIG_LEN = 64
+LEVELS = ("green", "amber", "red")
+
+
+def _signing_key():
+    if not SNAPSHOT_SIGNING_KEY or Ed25519PrivateKey is None:
+        return None
+    return Ed25519PrivateKey.from_private_bytes(bytes.fromhex(SNAPSHOT_SIGNING_KEY))
+
+
+def public_key_hex() -> Optional[str]:
+    key = _signing_key()
+    if key is None:
+        return None
+    from cryptography.hazmat.primitives import serialization  # type: ignore
+
+    raw = key.public_key().public_bytes(serialization.Encoding.Raw, serialization.PublicFormat.Raw)
+    return raw.hex()
+
+
+def encode(rows: List[Dict], kind: int, seq: int, base_seq: int, created_at: datetime) -> bytes:
+    """Serialize rows (dicts shaped like Site columns) into one snapshot file."""
+    rows = sorted(rows, key=lambda r: r["host"].encode("utf-8"))
+    hosts = [r["host"].encode("utf-8") for r in rows]
+    n = len(rows)
+    offsets = [0]
+    for h in hosts:
+        offsets.append(offsets[-1] + len(h))
+
+    def comp(r: Dict, key: str) -> int:
+        v = (r.get("last_breakdown") or {}).get(key) or 0.0
+        return max(0, min(10000, round(float(v) * 10000)))
+
+    key = _signing_key()
+    parts = [
+        HEADER.pack(MAGIC, FORMAT_VERSION, kind, FLAG_SIGNED if key else 0, n, seq, base_seq,
+                    int(created_at.timestamp()), 0),
+        struct.pack(f"<{n + 1}I", *offsets),
+        struct.pack(f"<{n}I", *(int(r["updated_at"].timestamp()) for r in rows)),
+        struct.pack(f"<{n}H", *(max(0, min(1000, round((r.get("last_score") or 0.0) * 10))) for r in rows)),
+        *(struct.pack(f"<{n}H", *(comp(r, k) for r in rows)) for k in ("S", "C", "T", "U")),
+        bytes(LEVELS.index(r.get("last_level")) if r.get("last_level") in LEVELS else 255 for r in rows),
+        b"".join(hosts),
+    ]
+    body = b"".join(parts)
+    sig = key.sign(body) if key else b"\0" * SIG_LEN
+    return body + sig
+
+
+class Snapshot:
+    """Read-only view over a snapshot file (bytes or mmap) with binary-search lookup."""
+
+    def __init__(self, buf):
+        self.buf = buf
+        magic, fmt, self.kind, self.flags, n, self.seq, self.base_seq, created, _ = HEADER.unpack_from(buf, 0)
+        if magic != MAGIC or fmt != FORMAT_VERSION:
+            raise ValueError("not an OpenSiteTrust snapshot (or unsupported format)")
+        self.count = n
+        self.created_at = datetime.fromtimestamp(created, timezone.utc)
+        self._offsets = HEADER.size
+        self._updated = self._offsets + 4 * (n + 1)
+        self._score = self._updated + 4 * n
+        self._comps = self._score + 2 * n
+        self._level = self._comps + 8 * n
+        self._hosts = self._level + n
+
+    @classmethod
+    def open(cls, path: str) -> "Snapshot":
+        with open(path, "rb") as f:
+            return cls(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+    def verify(self, public_key_hex: str) -> bool:
+        if Ed25519PublicKey is None or not self.flags & FLAG_SIGNED:
+            return False
+        body, sig = self.buf[:-SIG_LEN], self.buf[-SIG_LEN:]
+        try:
+            Ed25519PublicKey.from_public_bytes(bytes.fromhex(public_key_hex)).verify(bytes(sig), bytes(body))
+            return True
+        except Exception:
+            return False
+
+    def _host(self, i: int) -> bytes:
+        start, end = struct.unpack_from("<2I", self.buf, self._offsets + 4 * i)
+        return bytes(self.buf[self._hosts + start:self._hosts + end])
+
+    def lookup(self, host: str) -> Optional[Dict]:
+        target = host.encode("utf-8")
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._host(mid) < target:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo >= self.count or self._host(lo) != target:
+            return None
+        n, i = self.count, lo
+        (updated,) = struct.unpack_from("<I", self.buf, self._updated + 4 * i)
+        (score,) = struct.unpack_from("<H", self.buf, self._score + 2 * i)
+        comps = [struct.unpack_from("<H", self.buf, self._comps + 2 * (k * n + i))[0] / 10000 for k in range(4)]
+        level = self.buf[self._level + i]
+        return {
+            "host": host,
+            "score": score / 10,
+            "level": LEVELS[level] if level < len(LEVELS) else None,
+            "breakdown": dict(zip(("S", "C", "T", "U"), comps)),
+            "updated_at": datetime.fromtimestamp(updated, timezone.utc).isoformat(),
+        }
+
+
+def _write_atomic(path: str, data: bytes) -> None:
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def _encode_manifest(manifest: Dict) -> bytes:
+    payload = json.dumps(manifest, sort_keys=True, separators=(",", ":"))
+    key = _signing_key()
+    sig = key.sign(payload.encode("utf-8")).hex() if key else None
+    return json.dumps({"payload": payload, "signature": sig}, indent=2).encode()
+
+
+def read_manifest(data: bytes, public_key_hex: Optional[str]) -> Dict:
+    """Parse manifest.json, verifying its signature against a pinned public key.
+
+    Pass public_key_hex=None only to read an unsigned manifest deliberately.
+    Raises ValueError when the signature is missing or does not verify.
+    """
+    outer = json.loads(data)
+    payload = outer["payload"]
+    if public_key_hex is not None:
+        sig = outer.get("signature")
+        if not sig or Ed25519PublicKey is None:
+            raise ValueError("manifest is not signed")
+        try:
+            Ed25519PublicKey.from_public_bytes(bytes.fromhex(public_key_hex)).verify(
+                bytes.fromhex(sig), payload.encode("utf-8")
+            )
+        except Exception as e:
+            raise ValueError("manifest signature does not verify") from e
+    return json.loads(payload)
+
+
+def _load_manifest(directory: str) -> Optional[Dict]:
+    try:
+        with open(os.path.join(directory, "manifest.json"), "rb") as f:
+            m = read_manifest(f.read(), None)
+        return m if m.get("format") == FORMAT_VERSION else None
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+def _purge_retired(directory: str, manifest: Dict, now: datetime) -> None:
+    keep = []
+    for r in manifest.get("retired", []):
+        if datetime.fromisoformat(r["delete_after"]) > now:
+            keep.append(r)
+            continue
+        try:
+            os.remove(os.path.join(directory, r["file"]))
+        except OSError:
+            pass
+    manifest["retired"] = keep
+
+
+async def publish(directory: str = SNAPSHOT_DIR) -> Optional[Dict]:
+    """Write the next full or delta snapshot and update manifest.json.
+
+    A full snapshot is written when there is none yet or after SNAPSHOT_MAX_DELTAS
+    deltas; otherwise a delta of rows updated since the last watermark. Returns the
+    new manifest entry, or None when a delta would be empty. Files replaced by a
+    new full are listed under "retired" and deleted once their grace period ends.
+    """
+    os.makedirs(directory, exist_ok=True)
+    manifest = _load_manifest(directory)
+    full = manifest is None or len(manifest["deltas"]) >= SNAPSHOT_MAX_DELTAS
+    now = datetime.now(timezone.utc)
+    if manifest and manifest.get("retired"):
+        before = list(manifest["retired"])
+        _purge_retired(directory, manifest, now)
+        if manifest["retired"] != before:
+            _write_atomic(os.path.join(directory, "manifest.json"), _encode_manifest(manifest))
+    stmt = select(Site)
+    if not full:
+        since = datetime.fromisoformat(manifest["watermark"]) - timedelta(seconds=SNAPSHOT_OVERLAP_SECONDS)
+        stmt = stmt.where(Site.updated_at > since)
+    async with SessionLocal() as session:
+        sites = (await session.execute(stmt)).scalars().all()
+    rows = [
+        {
+            "host": s.host,
+            "last_score": s.last_score,
+            "last_breakdown": s.last_breakdown,
+            "last_level": s.last_level,
+            "updated_at": s.updated_at if s.updated_at.tzinfo else s.updated_at.replace(tzinfo=timezone.utc),
+        }
+        for s in sites
+    ]
+    if not full and not rows:
+        return None
+
+    seq = (manifest["seq"] + 1) if manifest else 1
+    base_seq = seq if full else manifest["full"]["seq"]
+    data = encode(rows, KIND_FULL if full else KIND_DELTA, seq, base_seq, now)
+    name = f"{'full' if full else 'delta'}-{seq:08d}.osts"
+    _write_atomic(os.path.join(directory, name), data)
+    entry = {
+        "file": name,
+        "seq": seq,
+        "base_seq": base_seq,
+        "count": len(rows),
+        "bytes": len(data),
+        "sha256": hashlib.sha256(data).hexdigest(),
+        "created_at": now.isoformat(),
+    }
+    if full:
+        retired = manifest.get("retired", []) if manifest else []
+        if manifest:
+            delete_after = (now + timedelta(seconds=SNAPSHOT_RETAIN_SECONDS)).isoformat()
+            retired += [
+                {"file": f, "delete_after": delete_after}
+                for f in [manifest["full"]["file"], *(d["file"] for d in manifest["deltas"])]
+            ]
+        manifest = {"format": FORMAT_VERSION, "full": entry, "deltas": [], "retired": retired}
+    else:
+        manifest["deltas"].append(entry)
+    manifest.update({"seq": seq, "watermark": now.isoformat(), "public_key": public_key_hex()})
+    _write_atomic(os.path.join(directory, "manifest.json"), _encode_manifest(manifest))
+    return entry
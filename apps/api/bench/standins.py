@@ -0,0 +1,165 @@
+"""Local stand-ins for everything the probes talk to.
+
+A fake HTTP/HTTPS origin (which also answers the Safe Browsing API path) and a
+UDP DNS server run on loopback in a background thread with their own event
+loop, so the API's blocking dnspython/TLS calls cannot deadlock them. Each
+stand-in counts the requests it serves.
+"""
+from __future__ import annotations
+import asyncio
+import ssl
+import threading
+from typing import Dict, Optional, Tuple
+
+import dns.message
+import dns.rcode
+import dns.rdatatype
+import dns.rrset
+import trustme
+
+# Paths that exist on the fake origin; every other path answers 404.
+FOUND_PATHS = {
+    "/", "/robots.txt", "/sitemap.xml", "/privacy", "/terms", "/about",
+    "/contact", "/.well-known/security.txt",
+}
+
+DEFAULT_HEADERS = {
+    "Strict-Transport-Security": "max-age=31536000",
+    "Content-Security-Policy": "default-src 'self'",
+    "X-Content-Type-Options": "nosniff",
+    "X-Frame-Options": "DENY",
+    "Referrer-Policy": "no-referrer",
+}
+
+HOMEPAGE_HEAD = (
+    "<!doctype html><html><head><title>Bench site</title>"
+    '<meta name="description" content="stand-in origin">'
+    '<link rel="canonical" href="/">'
+    '<meta property="og:title" content="Bench">'
+    '<script type="application/ld+json">{"@type": "WebSite"}</script>'
+    "</head><body>"
+)
+
+
+class Origin:
+    """Minimal HTTP/1.1 origin: plain HTTP redirects to HTTPS, HTTPS serves pages."""
+
+    def __init__(self, latency: float = 0.0, headers: Optional[Dict[str, str]] = None, page_kb: int = 64):
+        self.latency = latency
+        self.headers = dict(DEFAULT_HEADERS if headers is None else headers)
+        self.page = (HOMEPAGE_HEAD + "<p>" + "x" * (page_kb * 1024) + "</p></body></html>").encode()
+        self.requests = {"http": 0, "https": 0, "safe_browsing": 0}
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, tls: bool) -> None:
+        try:
+            line = (await reader.readline()).decode("latin-1")
+            if not line:
+                return
+            method, target, _ = line.split(" ", 2)
+            headers: Dict[str, str] = {}
+            while True:
+                h = await reader.readline()
+                if h in (b"\r\n", b"\n", b""):
+                    break
+                k, _, v = h.decode("latin-1").partition(":")
+                headers[k.strip().lower()] = v.strip()
+            length = int(headers.get("content-length") or 0)
+            if length:
+                await reader.readexactly(length)
+            if self.latency:
+                await asyncio.sleep(self.latency)
+            status, extra, body = self.route(method, target, headers.get("host", ""), tls)
+            head = [f"HTTP/1.1 {status}", f"Content-Length: {len(body)}", "Connection: close"]
+            head += [f"{k}: {v}" for k, v in extra.items()]
+            writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + body)
+            await writer.drain()
+        except Exception:
+            pass
+        finally:
+            writer.close()
+
+    def route(self, method: str, target: str, host: str, tls: bool) -> Tuple[str, Dict[str, str], bytes]:
+        if target.startswith("/v4/threatMatches:find"):
+            self.requests["safe_browsing"] += 1
+            return "200 OK", {"Content-Type": "application/json"}, b"{}"
+        self.requests["https" if tls else "http"] += 1
+        if not tls:
+            return "301 Moved Permanently", {"Location": f"https://{host}{target}"}, b""
+        path = target.split("?", 1)[0]
+        if path not in FOUND_PATHS:
+            return "404 Not Found", {"Content-Type": "text/plain"}, b"not found"
+        if path == "/":
+            return "200 OK", {"Content-Type": "text/html; charset=utf-8", **self.headers}, self.page
+        return "200 OK", {"Content-Type": "text/plain"}, b"ok\n"
+
+
+class DnsServer(asyncio.DatagramProtocol):
+    """Authoritative-looking answers for *.<zone>: MX, SPF and DMARC TXT; NXDOMAIN elsewhere."""
+
+    def __init__(self, zone: str, latency: float = 0.0):
+        self.zone = zone.strip(".").lower()
+        self.latency = latency
+        self.queries = 0
+        self.transport: Optional[asyncio.DatagramTransport] = None
+
+    def connection_made(self, transport) -> None:
+        self.transport = transport
+
+    def datagram_received(self, data: bytes, addr) -> None:
+        self.queries += 1
+        try:
+            query = dns.message.from_wire(data)
+        except Exception:
+            return
+        resp = dns.message.make_response(query)
+        q = query.question[0]
+        name = q.name.to_text().rstrip(".").lower()
+        if not (name == self.zone or name.endswith("." + self.zone)):
+            resp.set_rcode(dns.rcode.NXDOMAIN)
+        elif q.rdtype == dns.rdatatype.MX and not name.startswith("_"):
+            resp.answer.append(dns.rrset.from_text(q.name, 300, "IN", "MX", f"10 mail.{name}."))
+        elif q.rdtype == dns.rdatatype.TXT and name.startswith("_dmarc."):
+            resp.answer.append(dns.rrset.from_text(q.name, 300, "IN", "TXT", '"v=DMARC1; p=reject"'))
+        elif q.rdtype == dns.rdatatype.TXT:
+            resp.answer.append(dns.rrset.from_text(q.name, 300, "IN", "TXT", '"v=spf1 -all"'))
+        wire = resp.to_wire()
+        loop = asyncio.get_running_loop()
+        loop.call_later(self.latency, self.transport.sendto, wire, addr)
+
+
+class StandIns:
+    """Starts the origin and DNS server on 127.0.0.1 ephemeral ports in a background loop."""
+
+    def __init__(self, zone: str, origin: Origin, dns_latency: float = 0.0):
+        self.origin = origin
+        self.dns = DnsServer(zone, dns_latency)
+        self.ca = trustme.CA()
+        self.http_port = self.https_port = self.dns_port = 0
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+
+    def client_ssl_context(self) -> ssl.SSLContext:
+        ctx = ssl.create_default_context()
+        self.ca.configure_trust(ctx)
+        return ctx
+
+    async def _start(self) -> None:
+        server_ctx = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+        self.ca.issue_cert("127.0.0.1", "localhost").configure_cert(server_ctx)
+        http = await asyncio.start_server(lambda r, w: self.origin.handle(r, w, False), "127.0.0.1", 0)
+        https = await asyncio.start_server(lambda r, w: self.origin.handle(r, w, True), "127.0.0.1", 0, ssl=server_ctx)
+        self.http_port = http.sockets[0].getsockname()[1]
+        self.https_port = https.sockets[0].getsockname()[1]
+        transport, _ = await self._loop.create_datagram_endpoint(lambda: self.dns, local_addr=("127.0.0.1", 0))
+        self.dns_port = transport.get_extra_info("sockname")[1]
+
+    def start(self) -> "StandIns":
+        self._thread.start()
+        asyncio.run_coroutine_threadsafe(self._start(), self._loop).result(timeout=10)
+        return self
+
+    def stop(self) -> None:
+        self._loop.call_soon_threadsafe(self._loop.stop)
+
+    def counts(self) -> Dict[str, int]:
+        return {**self.origin.requests, "dns": self.dns.queries}
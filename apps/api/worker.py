@@ -1,11 +1,27 @@
 #!/usr/bin/env python3
 """
-Placeholder worker for MVP bootstrap.
-Future: move recompute tasks, rate-limit counters, and snapshotting here.
+Background worker.
+Expects the schema to be applied (python -m app.migrate).
+Publishes bulk snapshots of site scores (see app/snapshot.py) every
+SNAPSHOT_INTERVAL_SECONDS.
+Future: move recompute tasks and rate-limit counters here.
 """
-import time
+import asyncio
 
-if __name__ == "__main__":
-    print("Worker started (placeholder). Sleeping...")
+from app.snapshot import SNAPSHOT_DIR, SNAPSHOT_INTERVAL_SECONDS, publish
+
+
+async def main():
+    print(f"Worker started. Snapshots -> {SNAPSHOT_DIR} every {SNAPSHOT_INTERVAL_SECONDS}s")
     while True:
-        time.sleep(60)
+        try:
+            entry = await publish(SNAPSHOT_DIR)
+            if entry:
+                print(f"Snapshot {entry['file']}: {entry['count']} sites, {entry['bytes']} bytes")
+        except Exception as e:
+            print(f"Snapshot failed: {e!r}")
+        await asyncio.sleep(SNAPSHOT_INTERVAL_SECONDS)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())